@@ -12,6 +12,13 @@ def main():
 
         exit(0)
 
+    if args.autotune:
+        filename = launch_utils.run_autotune()
+
+        print(f"Runtime profile saved as {filename}. Exiting...")
+
+        exit(0)
+
     if not args.skip_prepare_environment:
         prepare_environment()
     
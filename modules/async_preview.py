@@ -0,0 +1,197 @@
+"""Renders preview images for LoRA checkpoints in a separate low-priority process.
+
+train_j.py starts this module with --preview-model. It watches the LoRA output directory, copies every
+newly saved LoRA into a snapshot directory and renders the prompts with it, so training never waits
+for the denoising loop. When rendering falls behind, the oldest pending snapshots are dropped.
+The worker finishes the queue and exits once its stdin is closed by the parent.
+
+The pipeline is loaded on the first snapshot. On CUDA it uses model CPU offload, so it only holds
+VRAM while a model is actually running. The lowered process priority only affects the CPU. Renders
+on the training GPU still compete with training kernels, so use a separate device to keep training
+step times flat.
+"""
+
+import argparse
+import collections
+import os
+import shutil
+import sys
+import threading
+import time
+
+
+def lower_priority():
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            below_normal_priority_class = 0x4000
+            ctypes.windll.kernel32.SetPriorityClass(ctypes.windll.kernel32.GetCurrentProcess(), below_normal_priority_class)
+        else:
+            os.nice(10)
+    except Exception as e:
+        print(f"Preview: could not lower process priority: {e}")
+
+
+def is_sdxl(model_path):
+    if not model_path.endswith(".safetensors"):
+        return False
+
+    from safetensors import safe_open
+
+    with safe_open(model_path, framework="pt") as file:
+        return any(key.startswith("conditioner.embedders.1") for key in file.keys())
+
+
+def load_pipeline(model_path, device):
+    import torch
+    from diffusers import StableDiffusionPipeline, StableDiffusionXLPipeline
+
+    pipeline_class = StableDiffusionXLPipeline if is_sdxl(model_path) else StableDiffusionPipeline
+    dtype = torch.float16 if device.startswith("cuda") else torch.float32
+    pipe = pipeline_class.from_single_file(model_path, torch_dtype=dtype)
+    pipe.set_progress_bar_config(disable=True)
+    if device.startswith("cuda"):
+        pipe.enable_model_cpu_offload(device=device)
+        return pipe
+    return pipe.to(device)
+
+
+def is_within(path, directory):
+    path, directory = os.path.abspath(path), os.path.abspath(directory)
+    try:
+        return os.path.commonpath([path, directory]) == directory
+    except ValueError:
+        return False
+
+
+class Watcher:
+    """Polls a directory for LoRA files that were written since the watcher started."""
+
+    def __init__(self, watch_dir, snapshot_dir, queue, condition, interval=5.0):
+        self.watch_dir = watch_dir
+        self.snapshot_dir = snapshot_dir
+        self.queue = queue
+        self.condition = condition
+        self.interval = interval
+        self.seen = self.scan()
+        self.pending = {}
+
+    def scan(self):
+        res = {}
+        for root, _, files in os.walk(self.watch_dir):
+            if is_within(root, self.snapshot_dir):
+                continue
+            for name in files:
+                if name.endswith(".safetensors"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    res[path] = (stat.st_mtime, stat.st_size)
+        return res
+
+    def poll(self, final=False):
+        """Snapshots files that are unchanged since the previous poll, or every changed file if final."""
+
+        for path, signature in self.scan().items():
+            if self.seen.get(path) == signature:
+                continue
+            if not final and self.pending.get(path) != signature:
+                self.pending[path] = signature
+                continue
+
+            self.seen[path] = signature
+            self.pending.pop(path, None)
+
+            stem = os.path.splitext(os.path.basename(path))[0]
+            snapshot = os.path.join(self.snapshot_dir, f"{stem}_{time.strftime('%Y%m%d_%H%M%S')}.safetensors")
+            try:
+                shutil.copyfile(path, snapshot)
+            except OSError as e:
+                print(f"Preview: could not snapshot {path}: {e}")
+                continue
+
+            with self.condition:
+                if len(self.queue) == self.queue.maxlen:
+                    dropped = self.queue[0]
+                    print(f"Preview: falling behind, dropping {os.path.basename(dropped)}")
+                    os.remove(dropped)
+                self.queue.append(snapshot)
+                self.condition.notify()
+
+    def run(self, stop):
+        while not stop.wait(self.interval):
+            self.poll()
+        self.poll(final=True)
+
+
+def render(pipe, snapshot, prompts, output_dir, steps, seed):
+    import torch
+
+    pipe.load_lora_weights(snapshot)
+    stem = os.path.splitext(os.path.basename(snapshot))[0]
+    try:
+        for i, prompt in enumerate(prompts):
+            generator = torch.Generator(device="cpu").manual_seed(seed)
+            image = pipe(prompt, num_inference_steps=steps, generator=generator).images[0]
+            image.save(os.path.join(output_dir, f"{stem}_{i:02d}.png"))
+    finally:
+        pipe.unload_lora_weights()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render preview images for LoRA files saved during training.")
+    parser.add_argument("--model", type=str, required=True, help="Base model checkpoint")
+    parser.add_argument("--watch-dir", type=str, required=True, help="Directory the trainer saves LoRA files into")
+    parser.add_argument("--output-dir", type=str, required=True, help="Directory for preview images and LoRA snapshots")
+    parser.add_argument("--prompt", nargs="+", required=True, help="Prompts to render for each snapshot")
+    parser.add_argument("--steps", type=int, default=20, help="Sampling steps")
+    parser.add_argument("--seed", type=int, default=0, help="Sampling seed")
+    parser.add_argument("--device", type=str, default="cuda", help="Device used for rendering")
+    parser.add_argument("--queue", type=int, default=2, help="Pending snapshots kept before the oldest is dropped")
+    args = parser.parse_args()
+
+    lower_priority()
+
+    snapshot_dir = os.path.join(args.output_dir, "snapshots")
+    os.makedirs(snapshot_dir, exist_ok=True)
+
+    queue = collections.deque(maxlen=max(1, args.queue))
+    condition = threading.Condition()
+    stop = threading.Event()
+    watcher = Watcher(args.watch_dir, snapshot_dir, queue, condition)
+
+    def wait_for_parent():
+        sys.stdin.read()
+        stop.set()
+
+    watch_thread = threading.Thread(target=watcher.run, args=(stop,), daemon=True)
+    watch_thread.start()
+    threading.Thread(target=wait_for_parent, daemon=True).start()
+
+    pipe = None
+    print(f"Preview: watching {args.watch_dir}, writing to {args.output_dir}")
+
+    while True:
+        with condition:
+            while not queue and watch_thread.is_alive():
+                condition.wait(timeout=1.0)
+            if not queue:
+                break
+            snapshot = queue.popleft()
+
+        try:
+            if pipe is None:
+                pipe = load_pipeline(args.model, args.device)
+            start = time.perf_counter()
+            render(pipe, snapshot, args.prompt, args.output_dir, args.steps, args.seed)
+            print(f"Preview: rendered {os.path.basename(snapshot)} in {time.perf_counter() - start:.1f}s")
+        except Exception as e:
+            print(f"Preview: failed to render {snapshot}: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+import io
+import json
+import os
+import platform
+import socket
+import time
+import weakref
+
+modules_path = os.path.dirname(os.path.realpath(__file__))
+script_path = os.path.dirname(modules_path)
+default_profile_path = os.path.join(script_path, "runtime_profile.json")
+
+profile_version = 1
+
+
+def physical_cores():
+    try:
+        import psutil
+        count = psutil.cpu_count(logical=False)
+        if count:
+            return count
+    except Exception:
+        pass
+
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf8") as file:
+            cores = set()
+            physical_id = core_id = None
+            for line in file:
+                if line.startswith("physical id"):
+                    physical_id = line.split(":", 1)[1].strip()
+                elif line.startswith("core id"):
+                    core_id = line.split(":", 1)[1].strip()
+                elif not line.strip():
+                    if core_id is not None:
+                        cores.add((physical_id, core_id))
+                    physical_id = core_id = None
+            if core_id is not None:
+                cores.add((physical_id, core_id))
+            if cores:
+                return len(cores)
+    except OSError:
+        pass
+
+    return os.cpu_count() or 1
+
+
+def usable_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def machine_fingerprint():
+    import torch
+
+    return {
+        "host": socket.gethostname(),
+        "machine": platform.machine(),
+        "logical_cores": os.cpu_count(),
+        "torch": torch.__version__,
+    }
+
+
+def candidates(limit):
+    values = [1]
+    while values[-1] * 2 <= limit:
+        values.append(values[-1] * 2)
+    if values[-1] != limit:
+        values.append(limit)
+    return values
+
+
+def pick(results, tolerance=0.05):
+    """Returns the smallest setting whose time is within tolerance of the best one."""
+
+    best = min(results.values())
+    return min(k for k, v in results.items() if v <= best * (1 + tolerance))
+
+
+def bench_intra_op_threads(size=1024, repeat=10):
+    import torch
+
+    original = torch.get_num_threads()
+    a = torch.randn(size, size)
+    b = torch.randn(size, size)
+    results = {}
+
+    try:
+        for threads in candidates(usable_cores()):
+            torch.set_num_threads(threads)
+            torch.mm(a, b)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                torch.mm(a, b)
+            results[threads] = time.perf_counter() - start
+    finally:
+        torch.set_num_threads(original)
+
+    return results
+
+
+class SyntheticImageDataset:
+    """Decodes and resizes an in-memory PNG, roughly the per-sample CPU work of an image dataset."""
+
+    def __init__(self, length=256, size=768):
+        import numpy as np
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.fromarray(np.random.randint(0, 255, (size, size, 3), dtype=np.uint8)).save(buffer, format="PNG")
+        self.data = buffer.getvalue()
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        import numpy as np
+        import torch
+        from PIL import Image
+
+        image = Image.open(io.BytesIO(self.data)).convert("RGB").resize((512, 512), Image.BICUBIC)
+        return torch.from_numpy(np.asarray(image).copy()).permute(2, 0, 1).float() / 255
+
+
+def time_loader(dataset, num_workers, prefetch_factor=None, pin_memory=False):
+    from torch.utils.data import DataLoader
+
+    kwargs = {"batch_size": 4, "num_workers": num_workers, "pin_memory": pin_memory}
+    if num_workers > 0 and prefetch_factor is not None:
+        kwargs["prefetch_factor"] = prefetch_factor
+
+    start = time.perf_counter()
+    for _ in DataLoader(dataset, **kwargs):
+        pass
+    return time.perf_counter() - start
+
+
+def bench_dataloader(max_workers=8):
+    dataset = SyntheticImageDataset()
+    workers = {n: time_loader(dataset, n) for n in [0] + candidates(min(max_workers, usable_cores()))}
+    num_workers = pick(workers)
+
+    prefetch = {}
+    if num_workers > 0:
+        prefetch = {n: time_loader(dataset, num_workers, prefetch_factor=n) for n in (2, 4, 8)}
+
+    return workers, prefetch
+
+
+def bench_pin_memory(size=64 * 1024 * 1024, repeat=10):
+    import torch
+
+    if not torch.cuda.is_available():
+        return None
+
+    results = {}
+    for pinned in (False, True):
+        tensor = torch.empty(size // 4, dtype=torch.float32, pin_memory=pinned)
+        tensor.to("cuda", non_blocking=pinned)
+        torch.cuda.synchronize()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            tensor.to("cuda", non_blocking=pinned)
+        torch.cuda.synchronize()
+        results[pinned] = time.perf_counter() - start
+
+    return results
+
+
+def run():
+    """Runs the micro-benchmarks and returns a runtime profile for this machine."""
+
+    print("Benchmarking intra-op threads...")
+    intra = bench_intra_op_threads()
+    num_threads = pick(intra)
+
+    print("Benchmarking dataloader workers...")
+    workers, prefetch = bench_dataloader()
+    num_workers = pick(workers)
+
+    print("Benchmarking pinned memory...")
+    pinned = bench_pin_memory()
+
+    return {
+        "version": profile_version,
+        "fingerprint": machine_fingerprint(),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "torch": {
+            "num_threads": num_threads,
+            "num_interop_threads": max(1, min(4, usable_cores() // num_threads)),
+        },
+        "dataloader": {
+            "num_workers": num_workers,
+            "prefetch_factor": pick(prefetch) if prefetch else None,
+            "persistent_workers": num_workers > 0,
+            "pin_memory": bool(pinned) and pinned[True] < pinned[False],
+        },
+        "benchmarks": {
+            "intra_op_threads": intra,
+            "dataloader_workers": workers,
+            "prefetch_factor": prefetch,
+            "pin_memory": pinned and {str(k): v for k, v in pinned.items()},
+        },
+    }
+
+
+def save_profile(profile, path=default_profile_path):
+    with open(path, "w", encoding="utf8") as file:
+        json.dump(profile, file, indent=4)
+
+
+def load_profile(path=default_profile_path):
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        with open(path, "r", encoding="utf8") as file:
+            return json.load(file)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Warning: Could not read runtime profile {path}: {e}")
+        return None
+
+
+def cpu_only(sample):
+    """True if every tensor in a (nested) sample lives on the CPU."""
+
+    import torch
+
+    if isinstance(sample, torch.Tensor):
+        return sample.device.type == "cpu"
+    if isinstance(sample, dict):
+        return all(cpu_only(v) for v in sample.values())
+    if isinstance(sample, (list, tuple)):
+        return all(cpu_only(v) for v in sample)
+    return True
+
+
+# dataset -> whether its first sample is on the CPU, so each dataset is loaded from only once
+checked_datasets = weakref.WeakKeyDictionary()
+
+
+def first_sample_on_cpu(dataset):
+    from torch.utils.data import IterableDataset
+
+    if isinstance(dataset, IterableDataset):
+        return False
+    try:
+        return checked_datasets[dataset]
+    except (KeyError, TypeError):
+        pass
+
+    try:
+        res = len(dataset) > 0 and cpu_only(dataset[0])
+    except Exception:
+        res = False
+
+    try:
+        checked_datasets[dataset] = res
+    except TypeError:
+        pass
+    return res
+
+
+def patch_dataloader(settings):
+    """Fills in DataLoader arguments the caller left at their defaults with the profiled values.
+
+    Only map-style datasets whose first sample holds CPU tensors are changed; that sample is loaded once
+    per dataset, and only if the profile would change the arguments. If construction or the
+    first batch fails with the profiled arguments, the loader is rebuilt with the caller's arguments.
+    """
+
+    from torch.utils.data import DataLoader
+
+    original_init = DataLoader.__init__
+    original_iter = DataLoader.__iter__
+
+    def init(self, *args, **kwargs):
+        dataset = args[0] if args else kwargs.get("dataset")
+        profiled = dict(kwargs)
+        # positional order: dataset, batch_size, shuffle, sampler, batch_sampler, num_workers, collate_fn, pin_memory
+        if len(args) <= 5 and "num_workers" not in kwargs:
+            profiled["num_workers"] = settings["num_workers"]
+        if len(args) <= 7 and "pin_memory" not in kwargs:
+            profiled["pin_memory"] = settings["pin_memory"]
+        if profiled.get("num_workers", args[5] if len(args) > 5 else 0) > 0:
+            if "prefetch_factor" not in kwargs and settings.get("prefetch_factor"):
+                profiled["prefetch_factor"] = settings["prefetch_factor"]
+            if "persistent_workers" not in kwargs:
+                profiled["persistent_workers"] = settings.get("persistent_workers", False)
+
+        if profiled != kwargs and first_sample_on_cpu(dataset):
+            try:
+                original_init(self, *args, **profiled)
+                self.profile_fallback_args = (args, kwargs)
+                return
+            except Exception as e:
+                print(f"Warning: DataLoader rejected the runtime profile ({e}), using the caller's arguments")
+        original_init(self, *args, **kwargs)
+
+    def iterate(self):
+        fallback = getattr(self, "profile_fallback", None)
+        if fallback is not None:
+            return iter(fallback)
+        if getattr(self, "profile_fallback_args", None) is None:
+            return original_iter(self)
+        return checked_iter(self)
+
+    def checked_iter(self):
+        try:
+            iterator = original_iter(self)
+            first = next(iterator)
+        except StopIteration:
+            return
+        except Exception as e:
+            print(f"Warning: DataLoader failed with the runtime profile ({e}), using the caller's arguments")
+            args, kwargs = self.profile_fallback_args
+            fallback = DataLoader.__new__(DataLoader)
+            original_init(fallback, *args, **kwargs)
+            self.profile_fallback = fallback
+            yield from iter(fallback)
+            return
+
+        self.profile_fallback_args = None
+        yield first
+        yield from iterator
+
+    DataLoader.__init__ = init
+    DataLoader.__iter__ = iterate
+
+
+def apply(path=default_profile_path, dataloader=False):
+    """Applies a stored runtime profile to this process. Must be called before training starts.
+
+    The DataLoader settings come from a synthetic image-decoding benchmark and are only applied if dataloader is set.
+    """
+
+    import torch
+
+    profile = load_profile(path)
+    if profile is None:
+        return None
+
+    if profile.get("version") != profile_version or profile.get("fingerprint") != machine_fingerprint():
+        print(f"Runtime profile {path} was created for a different machine or torch version, ignoring it. Run launch.py --autotune to refresh it.")
+        return None
+
+    settings = profile["torch"]
+    torch.set_num_threads(settings["num_threads"])
+    try:
+        torch.set_num_interop_threads(settings["num_interop_threads"])
+    except RuntimeError as e:
+        print(f"Warning: Could not set inter-op threads: {e}")
+
+    if dataloader:
+        patch_dataloader(profile["dataloader"])
+        print(f"Applied runtime profile {path}: {settings}, dataloader {profile['dataloader']}")
+    else:
+        print(f"Applied runtime profile {path}: {settings}")
+    return profile
@@ -0,0 +1,141 @@
+"""Opt-in torch.compile for the UNet with a compile cache shared across runs.
+
+The UNet's forward is compiled on its first call. The compiled function is kept on the instance
+and called from the class-level forward, so wrappers that accelerate or the trainer put on
+model.forward (autocast, output conversion) stay in place. Each bucket resolution gets its own
+static graph (dynamic=False) instead of one dynamic-shape graph. The Inductor FX graph cache and the Triton kernel
+cache live in a directory keyed by UNet architecture, dtype, device and torch version, so later runs
+and parallel sweep workers reuse compiled graphs; Inductor keys the entries within it by input shape.
+Dynamo still traces the model again in every process, which is part of the reported warmup.
+A step counts as warmup when Dynamo produced a new graph during one of its forward calls, whatever
+caused the recompile (a new shape, a changed guard or a graph break).
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import torch
+
+from modules import train_hooks
+
+modules_path = os.path.dirname(os.path.realpath(__file__))
+script_path = os.path.dirname(modules_path)
+default_cache_dir = os.path.join(script_path, "compile_cache")
+
+
+def cache_key(model, dtype):
+    config = json.dumps(dict(getattr(model, "config", {})), sort_keys=True, default=str)
+    device = torch.cuda.get_device_name() if torch.cuda.is_available() else "cpu"
+    key = f"{type(model).__name__}|{config}|{dtype}|{device}|{torch.__version__}"
+    return f"{type(model).__name__}-{str(dtype).replace('torch.', '')}-{hashlib.sha256(key.encode()).hexdigest()[:16]}"
+
+
+def shape_key(args, kwargs):
+    return tuple(tuple(v.shape) for v in list(args) + list(kwargs.values()) if isinstance(v, torch.Tensor))
+
+
+def unique_graphs():
+    from torch._dynamo.utils import counters
+
+    return counters["stats"]["unique_graphs"]
+
+
+class Compiler:
+    def __init__(self, cache_root=default_cache_dir, mode=None, max_shapes=32):
+        self.cache_root = cache_root
+        self.mode = mode
+        self.max_shapes = max_shapes
+        self.cache_dir = None
+        self.compiles = []
+        self.warmup_steps = 0
+        self.warmup_time = 0.0
+        self.step_times = []
+        self.recompiled = False
+        self.last_step = None
+
+    def install(self):
+        from diffusers import UNet2DConditionModel
+
+        original_forward = UNet2DConditionModel.forward
+        compiler = self
+
+        def forward(model, *args, **kwargs):
+            compiled = model.__dict__.get("_compiled_forward")
+            if compiled is None:
+                compiled = compiler.compile(model, original_forward.__get__(model))
+            return compiled(*args, **kwargs)
+
+        UNet2DConditionModel.forward = forward
+        train_hooks.on_step_end(self.on_step_end)
+
+    def compile(self, model, forward):
+        """Compiles forward for this UNet instance, stores it as model._compiled_forward and returns it."""
+
+        import torch._dynamo
+        import torch._inductor.config
+
+        if self.cache_dir is None:
+            self.cache_dir = os.path.join(self.cache_root, cache_key(model, model.dtype))
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # read when Inductor and Triton compile, so setting them before the first call is enough
+            os.environ["TORCHINDUCTOR_CACHE_DIR"] = os.path.join(self.cache_dir, "inductor")
+            os.environ["TRITON_CACHE_DIR"] = os.path.join(self.cache_dir, "triton")
+            torch._inductor.config.fx_graph_cache = True
+            torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, self.max_shapes)
+            print(f"Compile: caching in {self.cache_dir}")
+
+        compiled = torch.compile(forward, mode=self.mode, dynamic=False)
+
+        def call(*args, **kwargs):
+            graphs = unique_graphs()
+            start = time.perf_counter()
+            res = compiled(*args, **kwargs)
+            new_graphs = unique_graphs() - graphs
+            if new_graphs:
+                key = shape_key(args, kwargs)
+                self.compiles.append({"shapes": key, "graphs": new_graphs, "forward_s": time.perf_counter() - start})
+                self.recompiled = True
+                print(f"Compile: {new_graphs} new graph(s) for {key[0] if key else ()}, forward took {self.compiles[-1]['forward_s']:.1f}s")
+            return res
+
+        # model.forward is left alone: it may be a wrapper around the class-level forward
+        model._compiled_forward = call
+        if self.last_step is None:
+            self.last_step = time.perf_counter()
+        return call
+
+    def on_step_end(self, optimizer, step):
+        now = time.perf_counter()
+        if self.last_step is not None:
+            if self.recompiled:
+                self.warmup_steps += 1
+                self.warmup_time += now - self.last_step
+            else:
+                self.step_times.append(now - self.last_step)
+        self.recompiled = False
+        self.last_step = now
+
+    def report(self):
+        if self.cache_dir is None:
+            return
+
+        steady = sum(self.step_times) / len(self.step_times) if self.step_times else None
+        summary = {
+            "torch": torch.__version__,
+            "mode": self.mode,
+            "compiles": self.compiles,
+            "graphs": sum(c["graphs"] for c in self.compiles),
+            "warmup_steps": self.warmup_steps,
+            "warmup_s": self.warmup_time,
+            "steady_steps": len(self.step_times),
+            "steady_step_s": steady,
+        }
+        with open(os.path.join(self.cache_dir, f"run_{time.strftime('%Y%m%d_%H%M%S')}.json"), "w", encoding="utf8") as file:
+            json.dump(summary, file, indent=4)
+
+        message = f"Compile: warmup {self.warmup_time:.1f}s over {self.warmup_steps} step(s) with {len(self.compiles)} compile(s)"
+        if steady is not None:
+            message += f", steady-state step {steady * 1000:.1f}ms over {len(self.step_times)} step(s)"
+        print(message)
@@ -0,0 +1,347 @@
+"""Multi-tensor optimizer steps for the many small LoRA parameters.
+
+enable() wraps the constructors of the torch and third-party optimizers:
+ - fused=True when the optimizer accepts it and every parameter is a CUDA float tensor,
+ - otherwise foreach=True when the optimizer accepts it,
+ - otherwise, with enable(flat=True), for optimizers known to be purely elementwise (prodigy, dadaptation),
+   the parameters of each group are moved into one contiguous buffer that is handed to the optimizer as a single tensor.
+   The gradients of the original parameters are views into the buffer's gradient, so the optimizer,
+   GradScaler and gradient clipping always see the live gradients.
+If construction with these changes fails, the optimizer is built exactly as requested.
+Only CUDA parameters are touched; CPU training keeps the default path.
+"""
+
+import argparse
+import importlib
+import inspect
+import math
+import sys
+import time
+
+import torch
+
+third_party_modules = ["prodigyopt", "dadaptation", "schedulefree", "pytorch_optimizer"]
+
+# optimizers whose update treats every element independently, so flattening does not change the result
+flat_optimizers = {
+    ("prodigyopt", "Prodigy"),
+    ("dadaptation", "DAdaptAdam"),
+    ("dadaptation", "DAdaptAdan"),
+    ("dadaptation", "DAdaptLion"),
+    ("dadaptation", "DAdaptSGD"),
+}
+
+skip_optimizers = {"Optimizer", "LBFGS", "SparseAdam"}
+
+patched = {}
+flat_enabled = False
+
+
+def optimizer_classes():
+    modules = [torch.optim]
+    for name in third_party_modules:
+        try:
+            modules.append(importlib.import_module(name))
+        except Exception:
+            pass
+
+    res = {}
+    for module in modules:
+        for name in dir(module):
+            cls = getattr(module, name)
+            if inspect.isclass(cls) and issubclass(cls, torch.optim.Optimizer) and name not in skip_optimizers:
+                res[cls] = module.__name__
+    return res
+
+
+def param_groups(params):
+    """Normalizes the params argument of an optimizer into a list of group dicts with list params."""
+
+    params = list(params)
+    if params and not isinstance(params[0], dict):
+        params = [{"params": params}]
+    return [{**group, "params": list(group["params"]) if not isinstance(group["params"], torch.Tensor) else [group["params"]]} for group in params]
+
+
+def flatten(groups):
+    """Moves the tensors of each group into one contiguous buffer and returns (new groups, undo).
+
+    The gradient of the buffer is allocated once and each tensor's .grad is set to a view into it,
+    so backward accumulates straight into the buffer. undo() puts the original data, gradients and
+    hooks back, for when the optimizer cannot be built on the buffers.
+    """
+
+    res = []
+    originals = []
+    handles = []
+    for group in groups:
+        tensors = group["params"]
+        if len(tensors) < 2 or len({(p.device, p.dtype) for p in tensors}) != 1 or not all(p.requires_grad for p in tensors):
+            res.append(group)
+            continue
+
+        flat = torch.empty(sum(p.numel() for p in tensors), dtype=tensors[0].dtype, device=tensors[0].device)
+        flat_grad = torch.zeros_like(flat)
+        views = []
+        offset = 0
+        for p in tensors:
+            originals.append((p, p.data, p.grad))
+            view = flat[offset:offset + p.numel()]
+            view.copy_(p.data.reshape(-1))
+            p.data = view.view_as(p)
+
+            grad_view = flat_grad[offset:offset + p.numel()].view_as(p)
+            if p.grad is not None:
+                grad_view.copy_(p.grad)
+            p.grad = grad_view
+            views.append(grad_view)
+            offset += p.numel()
+
+        flat_param = torch.nn.Parameter(flat)
+        flat_param.grad = flat_grad
+        flat_param.flat_members = tensors
+        flat_param.flat_grad = flat_grad
+        flat_param.flat_views = views
+        for p, grad_view in zip(tensors, views):
+            handles.append(p.register_post_accumulate_grad_hook(keep_grad_view(flat_param, grad_view)))
+        res.append({**group, "params": [flat_param]})
+
+    def undo():
+        for handle in handles:
+            handle.remove()
+        for p, data, grad in originals:
+            data.copy_(p.data)
+            p.data = data
+            p.grad = grad
+
+    return res, undo
+
+
+def keep_grad_view(flat_param, grad_view):
+    """Puts a gradient that replaced the view (after something set .grad to None) back into the buffer."""
+
+    def hook(p):
+        if p.grad.data_ptr() != grad_view.data_ptr():
+            grad_view.copy_(p.grad)
+            p.grad = grad_view
+        if flat_param.grad is None:
+            flat_param.grad = flat_param.flat_grad
+
+    return hook
+
+
+def flat_params(optimizer):
+    return [p for group in optimizer.param_groups for p in group["params"] if hasattr(p, "flat_members")]
+
+
+def patch_zero_grad(optimizer):
+    """Zeroes flat gradient buffers in place instead of dropping them, so the member views stay attached."""
+
+    original_zero_grad = optimizer.zero_grad
+
+    def zero_grad(set_to_none=True):
+        original_zero_grad(set_to_none)
+        for flat_param in flat_params(optimizer):
+            flat_param.flat_grad.zero_()
+            flat_param.grad = flat_param.flat_grad
+            for p, grad_view in zip(flat_param.flat_members, flat_param.flat_views):
+                p.grad = grad_view
+
+    optimizer.zero_grad = zero_grad
+
+
+def fast_kwargs(cls, original_init, module_name, groups, kwargs):
+    """Returns (extra kwargs, flatten) for constructing cls with these parameters.
+
+    original_init is the constructor before patching; cls.__init__ is the wrapper by now.
+    """
+
+    tensors = [p for group in groups for p in group["params"]]
+    if not tensors or not all(p.is_cuda and p.is_floating_point() for p in tensors):
+        return {}, False
+    if kwargs.get("fused") is not None or kwargs.get("foreach") is not None:
+        return {}, False
+
+    signature = inspect.signature(original_init).parameters
+    if "fused" in signature:
+        return {"fused": True}, False
+    if "foreach" in signature:
+        return {"foreach": True}, False
+    return {}, flat_enabled and (module_name, cls.__name__) in flat_optimizers
+
+
+def patch_class(cls, module_name):
+    original_init = cls.__init__
+
+    def init(self, params, *args, **kwargs):
+        groups = param_groups(params)
+        extra, flat = fast_kwargs(cls, original_init, module_name, groups, kwargs) if type(self) is cls else ({}, False)
+
+        if extra or flat:
+            fast_groups, undo = flatten(groups) if flat else (groups, None)
+            try:
+                original_init(self, fast_groups, *args, **{**kwargs, **extra})
+                if flat:
+                    patch_zero_grad(self)
+                print(f"Optimizer {cls.__name__}: using {'flat buffers' if flat else ', '.join(extra)}")
+                return
+            except (TypeError, ValueError, RuntimeError) as e:
+                if undo is not None:
+                    undo()
+                print(f"Optimizer {cls.__name__}: fast path unavailable ({e}), using the default implementation")
+
+        original_init(self, groups, *args, **kwargs)
+
+    cls.__init__ = init
+    patched[cls] = original_init
+
+
+def enable(flat=False):
+    global flat_enabled
+
+    flat_enabled = flat
+    for cls, module_name in optimizer_classes().items():
+        if cls not in patched and "__init__" in cls.__dict__:
+            patch_class(cls, module_name)
+
+
+def disable():
+    for cls, original_init in patched.items():
+        cls.__init__ = original_init
+    patched.clear()
+
+
+bench_optimizers = [("torch.optim", "AdamW"), ("torch.optim", "Adam"), ("torch.optim", "SGD"), ("prodigyopt", "Prodigy"),
+                    ("dadaptation", "DAdaptAdam"), ("dadaptation", "DAdaptLion"), ("schedulefree", "AdamWScheduleFree"),
+                    ("pytorch_optimizer", "Lion"), ("pytorch_optimizer", "CAME")]
+
+
+def bench_classes():
+    for module_name, name in bench_optimizers:
+        try:
+            cls = getattr(importlib.import_module(module_name), name)
+        except Exception:
+            continue
+        kwargs = {"lr": 1.0 if module_name in ("prodigyopt", "dadaptation") else 1e-4}
+        yield module_name, name, (lambda params, cls=cls, kwargs=kwargs: cls(params, **kwargs))
+
+
+def lora_params(count, dim, rank, device, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    params = []
+    for _ in range(count):
+        params.append(torch.nn.Parameter((torch.randn(rank, dim, generator=generator) * 0.01).to(device)))
+        params.append(torch.nn.Parameter((torch.randn(dim, rank, generator=generator) * 0.01).to(device)))
+    grads = [torch.randn(p.shape, generator=generator).to(device) for p in params]
+    return params, grads
+
+
+def run_steps(make_optimizer, params, grads, steps, device, warmup=0):
+    """Runs zero_grad/backward/step like a training loop and returns the mean time of optimizer.step()."""
+
+    optimizer = make_optimizer(params)
+    if hasattr(optimizer, "train"):
+        optimizer.train()
+
+    elapsed = 0.0
+    for i in range(warmup + steps):
+        optimizer.zero_grad()
+        loss = sum((p * g).sum() for p, g in zip(params, grads)) * math.sin(i + 1)
+        loss.backward()
+
+        if device.startswith("cuda"):
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        optimizer.step()
+        if device.startswith("cuda"):
+            torch.cuda.synchronize()
+        if i >= warmup:
+            elapsed += time.perf_counter() - start
+    return elapsed / steps
+
+
+def check_fused(device):
+    """Checks that enable() actually builds AdamW with fused=True on CUDA parameters."""
+
+    try:
+        enable()
+        optimizer = torch.optim.AdamW(lora_params(1, 8, 2, device)[0], lr=1e-4)
+    finally:
+        disable()
+
+    fused = optimizer.defaults.get("fused")
+    print(f"torch.optim.AdamW: {'fused' if fused else 'NOT fused'} (fused={fused}, foreach={optimizer.defaults.get('foreach')})")
+    return bool(fused)
+
+
+def verify(count=16, dim=64, rank=4, steps=20, device=None, rtol=1e-3, atol=1e-5):
+    """Checks that the fast path ends with the same parameters as the default path after steps steps."""
+
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    if not device.startswith("cuda"):
+        print("Note: the fast path only applies to CUDA parameters, on CPU both paths are the default one")
+
+    ok = check_fused(device) if device.startswith("cuda") else True
+    for module_name, name, make_optimizer in bench_classes():
+        try:
+            disable()
+            plain, grads = lora_params(count, dim, rank, device)
+            run_steps(make_optimizer, plain, grads, steps, device)
+            enable(flat=True)
+            fast, grads = lora_params(count, dim, rank, device)
+            run_steps(make_optimizer, fast, grads, steps, device)
+        except Exception as e:
+            print(f"{module_name}.{name}: failed: {e}")
+            ok = False
+            continue
+        finally:
+            disable()
+
+        diff = max((a - b).abs().max().item() for a, b in zip(plain, fast))
+        match = all(torch.allclose(a, b, rtol=rtol, atol=atol) for a, b in zip(plain, fast))
+        ok = ok and match
+        print(f"{module_name}.{name}: {'match' if match else 'MISMATCH'} after {steps} steps (max abs diff {diff:.3g})")
+
+    return ok
+
+
+def benchmark(count=264, dim=768, rank=16, steps=50, device=None):
+    """Times optimizer.step() on LoRA-shaped parameters with the default and the fast path."""
+
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+
+    print(f"{count * 2} LoRA tensors (dim {dim}, rank {rank}) on {device}, {steps} steps")
+    print(f"{'optimizer':<28}{'default ms':>12}{'fast ms':>12}{'speedup':>10}")
+
+    results = {}
+    for module_name, name, make_optimizer in bench_classes():
+        try:
+            disable()
+            default = run_steps(make_optimizer, *lora_params(count, dim, rank, device), steps, device, warmup=5)
+            enable(flat=True)
+            fast = run_steps(make_optimizer, *lora_params(count, dim, rank, device), steps, device, warmup=5)
+        except Exception as e:
+            print(f"{module_name}.{name} failed: {e}")
+            continue
+        finally:
+            disable()
+
+        results[f"{module_name}.{name}"] = (default, fast)
+        print(f"{name:<28}{default * 1000:>12.3f}{fast * 1000:>12.3f}{default / fast:>9.2f}x")
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark or verify optimizer steps on LoRA-shaped parameters.")
+    parser.add_argument("--count", type=int, default=264, help="Number of LoRA modules (each has a down and an up matrix)")
+    parser.add_argument("--dim", type=int, default=768, help="Feature dimension of the LoRA modules")
+    parser.add_argument("--rank", type=int, default=16, help="LoRA rank")
+    parser.add_argument("--steps", type=int, default=50, help="Timed steps per optimizer")
+    parser.add_argument("--device", type=str, default=None, help="Device (default: cuda if available)")
+    parser.add_argument("--verify", action="store_true", help="Check that the fast path gives the same parameters as the default path instead of timing")
+    args = parser.parse_args()
+
+    if args.verify:
+        sys.exit(0 if verify(device=args.device) else 1)
+    benchmark(args.count, args.dim, args.rank, args.steps, args.device)
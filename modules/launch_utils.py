@@ -29,6 +29,7 @@ parser.add_argument("--disable-update", action='store_true', help="Disable auto-
 parser.add_argument("--skip-prepare-environment", action='store_true', help="launch.py argument: skip all environment preparation")
 parser.add_argument("--skip-install", action='store_true', help="launch.py argument: skip installation of packages")
 parser.add_argument("--dump-sysinfo", action='store_true', help="launch.py argument: dump limited sysinfo file (without information about extensions, options) to disk and quit")
+parser.add_argument("--autotune", action='store_true', help="launch.py argument: benchmark this machine, save the runtime profile applied by train_j.py and quit")
 parser.add_argument("--ngrok", type=str, help="ngrok authtoken, alternative to gradio --share", default=None)
 parser.add_argument("--xformers", action='store_true', help="enable xformers for cross attention layers")
 parser.add_argument("--use-cpu", nargs='+', help="use CPU as torch device for specified modules", default=[], type=str.lower)
@@ -341,6 +342,14 @@ def dump_sysinfo():
         file.write(text)
 
     return filename
+
+def run_autotune():
+    from modules import autotune
+
+    profile = autotune.run()
+    autotune.save_profile(profile)
+
+    return autotune.default_profile_path
     
 def git_pull(dirpath='.'):
     try:
@@ -0,0 +1,134 @@
+import argparse
+import os
+import time
+
+from modules import train_hooks
+
+
+def parse_steps(value):
+    """Parses "50-60" (or a single step "50") into an inclusive (start, end) step window.
+
+    The capture starts when the optimizer step before the window ends. Step 1 has no such step and
+    starting any earlier would include model loading and caching, so the window must start at step 2.
+    """
+
+    start, _, end = value.partition("-")
+    try:
+        start = int(start)
+        end = int(end) if end else start
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid step window: {value}")
+    if start < 2:
+        raise argparse.ArgumentTypeError(f"invalid step window: {value}, the window must start at step 2 or later so that startup is not profiled")
+    if end < start:
+        raise argparse.ArgumentTypeError(f"invalid step window: {value}")
+    return start, end
+
+
+class StepProfiler:
+    """Captures a torch.profiler or cProfile trace for optimizer steps start..end (inclusive, 1-based)."""
+
+    def __init__(self, mode, steps, output_dir, top=30):
+        self.mode = mode
+        self.start, self.end = steps
+        self.output_dir = output_dir
+        self.top = top
+        self.profiler = None
+        self.started = None
+        self.finished = False
+
+    def install(self):
+        train_hooks.on_step_end(self.on_step_end)
+
+    def on_step_end(self, optimizer, step):
+        if self.finished:
+            return
+
+        if self.profiler is None:
+            if step == self.start - 1:
+                self.begin()
+            return
+
+        if self.mode == "torch":
+            self.profiler.step()
+
+        if step >= self.end:
+            self.finish(step)
+
+    def begin(self):
+        if self.mode == "torch":
+            import torch
+            from torch.profiler import profile, ProfilerActivity
+
+            activities = [ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(ProfilerActivity.CUDA)
+
+            self.profiler = profile(activities=activities, record_shapes=True, profile_memory=True, with_stack=True)
+        else:
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+
+        print(f"Profiler: capturing steps {self.start}-{self.end} ({self.mode})")
+        self.started = time.perf_counter()
+        if self.mode == "torch":
+            self.profiler.start()
+        else:
+            self.profiler.enable()
+
+    def finish(self, step=None):
+        """Stops the capture and writes the results. Safe to call more than once."""
+
+        if self.finished:
+            return
+        self.finished = True
+
+        if self.profiler is None:
+            print(f"Warning: Profiler: training ended at step {train_hooks.step}, before the requested window {self.start}-{self.end}. No trace was captured.")
+            return
+
+        if self.mode == "torch":
+            self.profiler.stop()
+        else:
+            self.profiler.disable()
+
+        elapsed = time.perf_counter() - self.started
+        end = step if step is not None else train_hooks.step
+        name = f"steps{self.start}-{end}"
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        if self.mode == "torch":
+            self.write_torch(name)
+        else:
+            self.write_cprofile(name)
+
+        print(f"Profiler: {end - self.start + 1} steps in {elapsed:.2f}s, results saved to {self.output_dir}")
+
+    def write_torch(self, name):
+        import torch
+
+        sort_by = "self_cuda_time_total" if torch.cuda.is_available() else "self_cpu_time_total"
+
+        self.profiler.export_chrome_trace(os.path.join(self.output_dir, f"trace_{name}.json"))
+        self.profiler.export_stacks(os.path.join(self.output_dir, f"stacks_{name}.txt"), "self_cpu_time_total")
+
+        with open(os.path.join(self.output_dir, f"hotspots_{name}.txt"), "w", encoding="utf8") as file:
+            file.write(f"Top {self.top} ops by {sort_by}\n\n")
+            file.write(self.profiler.key_averages().table(sort_by=sort_by, row_limit=self.top))
+            file.write(f"\n\nTop {self.top} call stacks by {sort_by}\n\n")
+            file.write(self.profiler.key_averages(group_by_stack_n=5).table(sort_by=sort_by, row_limit=self.top))
+            file.write(f"\n\nTop {self.top} ops by self_cpu_memory_usage\n\n")
+            file.write(self.profiler.key_averages().table(sort_by="self_cpu_memory_usage", row_limit=self.top))
+
+    def write_cprofile(self, name):
+        import pstats
+
+        self.profiler.dump_stats(os.path.join(self.output_dir, f"profile_{name}.prof"))
+
+        with open(os.path.join(self.output_dir, f"hotspots_{name}.txt"), "w", encoding="utf8") as file:
+            stats = pstats.Stats(self.profiler, stream=file).strip_dirs()
+            file.write(f"Top {self.top} functions by cumulative time\n\n")
+            stats.sort_stats("cumulative").print_stats(self.top)
+            file.write(f"\nTop {self.top} functions by own time\n\n")
+            stats.sort_stats("tottime").print_stats(self.top)
@@ -0,0 +1,152 @@
+import json
+import os
+
+import torch
+
+from modules import train_hooks
+
+
+class RunState:
+    """Records the training loss, stops training at a given step and saves/restores the trained weights.
+
+    The loss is taken from the scalar passed to Tensor.backward(). With gradient accumulation the
+    values between two optimizer steps are averaged. If the trainer scales the loss (fp16 GradScaler)
+    the recorded value is scaled too.
+
+    The state file holds the tensors the optimizer updates plus the optimizer and LR scheduler states,
+    taken after the optimizer step and before the scheduler step. On resume the first optimizer step
+    only restores them: its gradients were computed with the initial weights, so they are dropped and
+    the step is not counted. The scheduler step that follows it then continues the saved schedule.
+    Only the weights, optimizer and LR schedule are restored: the trainer starts its data order (and
+    random augmentation) from the beginning again, and the forward/backward of that first step is
+    thrown away, so a resumed run is close to but not the same as an uninterrupted one.
+
+    Training stops at the start of the step after stop_at_step. A run that never resumed and whose own
+    loop ends at stop_at_step therefore finishes normally and the trainer still saves its output. After
+    a resume the trainer's loop counter starts at 0 again, so its loop ends after stop_at_step; with
+    skip_after_stop the remaining steps of that loop run without updating the weights instead, and the
+    trainer saves its output at the end of its loop with the weights of stop_at_step.
+    """
+
+    def __init__(self, metrics_file=None, state_file=None, stop_at_step=None, skip_after_stop=False, loss_window=20):
+        self.metrics_file = metrics_file
+        self.state_file = state_file
+        self.stop_at_step = stop_at_step
+        self.skip_after_stop = skip_after_stop
+        self.loss_window = loss_window
+        self.losses = []
+        self.pending = []
+        self.optimizer = None
+        self.schedulers = []
+        self.stopped = False
+        self.finished = False
+        self.resume = state_file is not None and os.path.isfile(state_file)
+
+    def install(self):
+        original_backward = torch.Tensor.backward
+
+        def backward(tensor, *args, **kwargs):
+            if tensor.dim() == 0:
+                self.pending.append(tensor.detach())
+            return original_backward(tensor, *args, **kwargs)
+
+        torch.Tensor.backward = backward
+
+        original_scheduler_init = torch.optim.lr_scheduler.LRScheduler.__init__
+
+        def scheduler_init(scheduler, *args, **kwargs):
+            original_scheduler_init(scheduler, *args, **kwargs)
+            if scheduler not in self.schedulers:
+                self.schedulers.append(scheduler)
+
+        torch.optim.lr_scheduler.LRScheduler.__init__ = scheduler_init
+
+        train_hooks.on_step_start(self.on_step_start)
+        train_hooks.on_step_end(self.on_step_end)
+
+    def on_step_start(self, optimizer, step):
+        if self.stopped:
+            if not self.skip_after_stop:
+                raise train_hooks.StopTraining(f"stopped at step {step}")
+            # optimizers skip tensors without a gradient, so the step leaves the weights as they are
+            for p in self.params(optimizer):
+                p.grad = None
+            return
+
+        self.optimizer = optimizer
+        if self.resume:
+            self.resume = False
+            self.load(optimizer)
+
+    def on_step_end(self, optimizer, step):
+        if self.pending:
+            self.losses.append(torch.stack(self.pending).float().mean().item())
+            self.pending.clear()
+
+        if self.stop_at_step is not None and step >= self.stop_at_step and not self.stopped:
+            self.finish()
+            self.stopped = True
+            if self.skip_after_stop:
+                print(f"Stopped training at step {step}, skipping the rest of the trainer's loop")
+
+    def optimizer_schedulers(self, optimizer):
+        # accelerate hands the scheduler its wrapped optimizer
+        return [scheduler for scheduler in self.schedulers if getattr(scheduler.optimizer, "optimizer", scheduler.optimizer) is optimizer]
+
+    def params(self, optimizer):
+        return [p for group in optimizer.param_groups for p in group["params"]]
+
+    def load(self, optimizer):
+        state = torch.load(self.state_file, map_location="cpu")
+        params = self.params(optimizer)
+        if len(params) != len(state["params"]) or any(p.shape != s.shape for p, s in zip(params, state["params"])):
+            raise RuntimeError(f"State file {self.state_file} does not match the parameters being trained")
+
+        with torch.no_grad():
+            for p, s in zip(params, state["params"]):
+                p.copy_(s)
+                p.grad = None
+        optimizer.load_state_dict(state["optimizer"])
+
+        schedulers = self.optimizer_schedulers(optimizer)
+        if len(schedulers) == len(state.get("schedulers", [])):
+            for scheduler, scheduler_state in zip(schedulers, state["schedulers"]):
+                scheduler.load_state_dict(scheduler_state)
+        else:
+            print(f"Warning: {self.state_file} has {len(state.get('schedulers', []))} LR scheduler state(s) but {len(schedulers)} scheduler(s) were created, the LR schedule starts over")
+
+        self.losses = state.get("losses", [])
+        self.pending.clear()
+        train_hooks.step = state["step"] - 1
+        print(f"Resumed from {self.state_file} at step {state['step']}")
+
+    def save(self):
+        if self.state_file is None or self.optimizer is None:
+            return
+
+        torch.save({
+            "step": train_hooks.step,
+            "params": [p.detach().cpu() for p in self.params(self.optimizer)],
+            "optimizer": self.optimizer.state_dict(),
+            "schedulers": [scheduler.state_dict() for scheduler in self.optimizer_schedulers(self.optimizer)],
+            "losses": self.losses,
+        }, self.state_file)
+
+    def write_metrics(self):
+        if self.metrics_file is None:
+            return
+
+        window = self.losses[-self.loss_window:]
+        with open(self.metrics_file, "w", encoding="utf8") as file:
+            json.dump({
+                "step": train_hooks.step,
+                "loss": sum(window) / len(window) if window else None,
+                "losses": self.losses,
+            }, file)
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        self.save()
+        self.write_metrics()
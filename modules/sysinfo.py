@@ -0,0 +1,180 @@
+import json
+import os
+import sys
+import time
+import platform
+import tempfile
+import importlib.metadata
+
+from modules import autotune
+
+disk_test_size = 64 * 1024 * 1024
+
+
+def read_text(path):
+    try:
+        with open(path, "r", encoding="utf8") as file:
+            return file.read()
+    except OSError:
+        return None
+
+
+def get_cpu_info():
+    res = {
+        "processor": platform.processor(),
+        "machine": platform.machine(),
+        "logical_cores": os.cpu_count(),
+        "physical_cores": autotune.physical_cores(),
+    }
+
+    if hasattr(os, "sched_getaffinity"):
+        res["usable_cores"] = len(os.sched_getaffinity(0))
+
+    cpuinfo = read_text("/proc/cpuinfo")
+    if cpuinfo:
+        for line in cpuinfo.splitlines():
+            if line.startswith("model name"):
+                res["model"] = line.split(":", 1)[1].strip()
+                break
+        res["sockets"] = len({line.split(":", 1)[1].strip() for line in cpuinfo.splitlines() if line.startswith("physical id")}) or None
+
+    return res
+
+
+def get_ram_info():
+    try:
+        import psutil
+        ram = psutil.virtual_memory()
+        return {"total": ram.total, "available": ram.available}
+    except Exception:
+        pass
+
+    meminfo = read_text("/proc/meminfo")
+    if meminfo:
+        values = {}
+        for line in meminfo.splitlines():
+            key, _, value = line.partition(":")
+            if key in ("MemTotal", "MemAvailable"):
+                values[key] = int(value.split()[0]) * 1024
+        return {"total": values.get("MemTotal"), "available": values.get("MemAvailable")}
+
+    return None
+
+
+def get_numa_info():
+    node_root = "/sys/devices/system/node"
+    if not os.path.isdir(node_root):
+        return None
+
+    nodes = {}
+    for name in sorted(os.listdir(node_root)):
+        if not (name.startswith("node") and name[4:].isdigit()):
+            continue
+
+        node = {"cpus": (read_text(os.path.join(node_root, name, "cpulist")) or "").strip()}
+        meminfo = read_text(os.path.join(node_root, name, "meminfo"))
+        if meminfo:
+            for line in meminfo.splitlines():
+                if "MemTotal:" in line:
+                    node["memory"] = int(line.split()[-2]) * 1024
+        nodes[name] = node
+
+    return nodes
+
+
+def get_disk_info(path="."):
+    """Writes and reads back a temporary file to get a rough sequential throughput of the disk holding path.
+
+    The read figure may be served from the page cache, so treat it as an upper bound.
+    """
+
+    block = os.urandom(4 * 1024 * 1024)
+    res = {"path": os.path.abspath(path)}
+
+    try:
+        fd, filename = tempfile.mkstemp(dir=path, prefix=".sysinfo-disk-")
+        try:
+            start = time.perf_counter()
+            with os.fdopen(fd, "wb") as file:
+                for _ in range(disk_test_size // len(block)):
+                    file.write(block)
+                file.flush()
+                os.fsync(file.fileno())
+            res["write_mb_s"] = round(disk_test_size / (time.perf_counter() - start) / 1024 ** 2, 1)
+
+            start = time.perf_counter()
+            with open(filename, "rb") as file:
+                while file.read(len(block)):
+                    pass
+            res["read_mb_s"] = round(disk_test_size / (time.perf_counter() - start) / 1024 ** 2, 1)
+        finally:
+            os.remove(filename)
+    except OSError as e:
+        res["error"] = str(e)
+
+    return res
+
+
+def get_torch_info():
+    try:
+        import torch
+    except Exception as e:
+        return {"error": str(e)}
+
+    res = {
+        "version": torch.__version__,
+        "cuda": torch.version.cuda,
+        "hip": getattr(torch.version, "hip", None),
+        "cudnn": torch.backends.cudnn.version() if torch.backends.cudnn.is_available() else None,
+        "mkl": torch.backends.mkl.is_available(),
+        "mkldnn": torch.backends.mkldnn.is_available(),
+        "openmp": torch.backends.openmp.is_available(),
+        "num_threads": torch.get_num_threads(),
+        "num_interop_threads": torch.get_num_interop_threads(),
+        "build_config": torch.__config__.show().splitlines(),
+        "parallel_info": torch.__config__.parallel_info().splitlines(),
+        "devices": [],
+    }
+
+    if torch.cuda.is_available():
+        for i in range(torch.cuda.device_count()):
+            props = torch.cuda.get_device_properties(i)
+            res["devices"].append({
+                "name": props.name,
+                "memory": props.total_memory,
+                "capability": f"{props.major}.{props.minor}",
+                "multiprocessors": props.multi_processor_count,
+            })
+
+    return res
+
+
+def get_packages():
+    names = ["torch", "torchvision", "xformers", "diffusers", "transformers", "accelerate", "safetensors", "gradio", "numpy"]
+    res = {}
+    for name in names:
+        try:
+            res[name] = importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            res[name] = None
+
+    return res
+
+
+def get_dict():
+    return {
+        "Platform": platform.platform(),
+        "Python": platform.python_version(),
+        "Executable": sys.executable,
+        "CPU": get_cpu_info(),
+        "RAM": get_ram_info(),
+        "NUMA": get_numa_info(),
+        "Disk": get_disk_info(),
+        "Torch": get_torch_info(),
+        "Packages": get_packages(),
+        "Runtime profile": autotune.load_profile(),
+    }
+
+
+def get():
+    return json.dumps(get_dict(), sort_keys=False, indent=4)
@@ -0,0 +1,53 @@
+"""Observes the training loop of traintrain from the outside.
+
+traintrain is cloned into the tree and not edited here, so per-step features hook into
+torch's global optimizer step hooks instead. Nothing is registered until a callback is added,
+so unused features cost nothing.
+"""
+
+from torch.optim.optimizer import register_optimizer_step_pre_hook, register_optimizer_step_post_hook
+
+step = 0
+pre_callbacks = []
+post_callbacks = []
+handles = []
+
+
+class StopTraining(BaseException):
+    """Raised from a callback to end training early. Derives from BaseException so that the
+    trainer's own `except Exception` blocks do not swallow it."""
+
+    pass
+
+
+def pre_hook(optimizer, args, kwargs):
+    for callback in pre_callbacks:
+        callback(optimizer, step)
+
+
+def post_hook(optimizer, args, kwargs):
+    global step
+    step += 1
+
+    for callback in post_callbacks:
+        callback(optimizer, step)
+
+
+def install():
+    if not handles:
+        handles.append(register_optimizer_step_pre_hook(pre_hook))
+        handles.append(register_optimizer_step_post_hook(post_hook))
+
+
+def on_step_start(callback):
+    """callback(optimizer, step) runs before each optimizer step; step counts completed steps."""
+
+    install()
+    pre_callbacks.append(callback)
+
+
+def on_step_end(callback):
+    """callback(optimizer, step) runs after each optimizer step; step is 1-based."""
+
+    install()
+    post_callbacks.append(callback)
@@ -1,8 +1,12 @@
 import argparse
+import datetime
 import os
+import subprocess
+import sys
 from traintrain.trainer.train import train_main
 from traintrain.trainer.trainer import import_json
 import traintrain.scripts.traintrain
+from modules import autotune, compile_cache, fast_optim, profiling, run_state, train_hooks
 
 def main():
     parser = argparse.ArgumentParser(description="Load and display JSON file content.")
@@ -12,13 +16,91 @@ def main():
     parser.add_argument("--ckpt-dir", type=str, default=None, help="Directory for StableDiffusion Models (overrides --models-dir)")
     parser.add_argument("--vae-dir", type=str, default=None, help="Directory for VAE (overrides --models-dir)")
     parser.add_argument("--lora-dir", type=str, default=None, help="Directory for LoRA (overrides --models-dir)")
+    parser.add_argument("--runtime-profile", type=str, default=autotune.default_profile_path, help="Runtime profile written by launch.py --autotune (applied if it exists)")
+    parser.add_argument("--no-runtime-profile", action="store_true", help="Do not apply the runtime profile")
+    parser.add_argument("--runtime-profile-dataloader", action="store_true", help="Also apply the profiled DataLoader workers, prefetch and pinned memory to loaders with CPU samples")
+    parser.add_argument("--profile", type=str, default=None, choices=["torch", "cprofile"], help="Capture a torch.profiler or cProfile trace for --profile-steps")
+    parser.add_argument("--profile-steps", type=profiling.parse_steps, default="50-60", help="Inclusive optimizer step window to profile, e.g. 50-60")
+    parser.add_argument("--profile-dir", type=str, default=None, help="Directory for traces and the hotspot summary (default: profiles/<json name>_<timestamp>)")
+    parser.add_argument("--profile-top", type=int, default=30, help="Number of hotspots listed in the summary")
+    parser.add_argument("--optimizer-impl", type=str, default="auto", choices=["auto", "flat", "default"], help="auto: use fused/foreach optimizer steps where supported, flat: also put Prodigy/D-Adaptation parameters into one contiguous buffer")
+    parser.add_argument("--compile", type=str, default=None, choices=["default", "reduce-overhead", "max-autotune"], help="Compile the UNet with torch.compile in this mode")
+    parser.add_argument("--compile-cache-dir", type=str, default=compile_cache.default_cache_dir, help="Directory for compiled graphs, shared across runs")
+    parser.add_argument("--compile-max-shapes", type=int, default=32, help="Number of input shapes (bucket resolutions) compiled before falling back to eager")
+    parser.add_argument("--metrics-file", type=str, default=None, help="Write the step count and recent training loss to this JSON file when training ends")
+    parser.add_argument("--state-file", type=str, default=None, help="Save the trained weights and optimizer state here when training ends, and resume from it if it exists")
+    parser.add_argument("--stop-at-step", type=int, default=None, help="Stop training after this many optimizer steps (counted across resumes)")
+    parser.add_argument("--skip-after-stop", action="store_true", help="After --stop-at-step, run the rest of the trainer's loop without updating the weights so that the trainer still saves its final LoRA")
+    parser.add_argument("--preview-model", type=str, default=None, help="Render previews of saved LoRA files with this base model in a separate low-priority process")
+    parser.add_argument("--preview-prompt", nargs="+", default=["a photo"], help="Prompts rendered for each saved LoRA")
+    parser.add_argument("--preview-watch-dir", type=str, default=None, help="Directory the LoRA files are saved into (default: --lora-dir)")
+    parser.add_argument("--preview-dir", type=str, default=None, help="Directory for preview images (default: previews/<json name>_<timestamp>)")
+    parser.add_argument("--preview-device", type=str, default="cuda", help="Device used for rendering previews; use a GPU other than the training one (or cpu) to keep step times flat")
+    parser.add_argument("--preview-steps", type=int, default=20, help="Sampling steps for previews")
+    parser.add_argument("--preview-queue", type=int, default=2, help="Pending LoRA snapshots kept before the oldest is dropped")
     
     args = parser.parse_args()
+    if not args.no_runtime_profile:
+        autotune.apply(args.runtime_profile, dataloader=args.runtime_profile_dataloader)
+    if args.optimizer_impl != "default":
+        fast_optim.enable(flat=args.optimizer_impl == "flat")
+
     paths = [args.models_dir, args.ckpt_dir, args.vae_dir, args.lora_dir]
+    run_name = f"{os.path.splitext(os.path.basename(args.json_path))[0]}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
+    profiler = None
+    if args.profile:
+        profile_dir = args.profile_dir or os.path.join("profiles", run_name)
+        profiler = profiling.StepProfiler(args.profile, args.profile_steps, profile_dir, args.profile_top)
+
+    compiler = None
+    if args.compile:
+        compiler = compile_cache.Compiler(args.compile_cache_dir, None if args.compile == "default" else args.compile, args.compile_max_shapes)
+
+    state = None
+    if args.metrics_file or args.state_file or args.stop_at_step:
+        state = run_state.RunState(args.metrics_file, args.state_file, args.stop_at_step, args.skip_after_stop)
+
+    preview = None
+    if args.preview_model:
+        watch_dir = args.preview_watch_dir or args.lora_dir
+        if watch_dir is None:
+            parser.error("--preview-model needs --preview-watch-dir or --lora-dir")
+        command = [
+            sys.executable, "-m", "modules.async_preview",
+            "--model", os.path.abspath(args.preview_model),
+            "--watch-dir", os.path.abspath(watch_dir),
+            "--output-dir", os.path.abspath(args.preview_dir or os.path.join("previews", run_name)),
+            "--device", args.preview_device,
+            "--steps", str(args.preview_steps),
+            "--queue", str(args.preview_queue),
+            "--prompt", *args.preview_prompt,
+        ]
+        preview = subprocess.Popen(command, stdin=subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__)))
+
     inputs = import_json(args.json_path, cli = True)
     print(inputs)
-    result = train_main(paths, *inputs)
+    if profiler is not None:
+        profiler.install()
+    if state is not None:
+        state.install()
+    if compiler is not None:
+        compiler.install()
+    try:
+        result = train_main(paths, *inputs)
+        if state is not None:
+            state.finish()
+    except train_hooks.StopTraining as e:
+        result = f"Training {e}"
+    finally:
+        if profiler is not None:
+            profiler.finish()
+        if compiler is not None:
+            compiler.report()
+        if preview is not None:
+            print("Waiting for pending previews...")
+            preview.stdin.close()
+            preview.wait()
     print(result)
 
 if __name__ == "__main__":
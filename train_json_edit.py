@@ -18,6 +18,53 @@ def parse_override_value(value_str):
         print(f"Warning: Failed to parse override value '{value_str}': {e}")
         return value_str
 
+def apply_overrides(config_data, overrides):
+    overrides_applied = False
+    for item in overrides:
+        parts = item.split(':', 1)
+        if len(parts) == 2:
+            key = parts[0].strip()
+            value_str = parts[1].strip()
+            if not key:
+                print(f"  Warning: Invalid override format (empty key): '{item}'. Skipping.")
+                continue
+
+            parsed_value = parse_override_value(value_str)
+            keys = key.split('.')
+            current_level = config_data
+            try:
+                for i, k in enumerate(keys[:-1]):
+                    if isinstance(current_level, dict) and k in current_level:
+                         if isinstance(current_level[k], dict):
+                             current_level = current_level[k]
+                         else:
+                             print(f"  Warning: Intermediate key '{k}' in '{key}' exists but is not a dictionary. Cannot traverse further. Skipping override.")
+                             current_level = None
+                             break
+                    else:
+                         print(f"  Warning: Intermediate key '{k}' in '{key}' not found. Skipping override.")
+                         current_level = None
+                         break
+
+                if current_level is not None:
+                    final_key = keys[-1]
+                    if isinstance(current_level, dict):
+                        if final_key in current_level:
+                            original_value = current_level.get(final_key, '<Key did not exist>')
+                            print(f"  Overriding key '{key}': '{original_value}' (original) -> '{parsed_value}' ({type(parsed_value).__name__})")
+                            current_level[final_key] = parsed_value
+                            overrides_applied = True
+                        else:
+                            print(f"  Warning: Key '{key}' (or final key '{final_key}') not found in the configuration. Skipping override.")
+                    else:
+                        print(f"  Warning: Cannot apply final key '{final_key}' because the target level is not a dictionary. Skipping override for '{key}'.")
+
+            except Exception as e:
+                print(f"  Error applying override for key '{key}' with value string '{value_str}': {e}. Skipping.")
+        else:
+            print(f"  Warning: Invalid override format (missing ':'?): '{item}'. Skipping.")
+    return overrides_applied
+
 def main():
     parser = argparse.ArgumentParser(
         description="Load JSON config, apply overrides, save to a specified/default directory, and run train_j.py.",
@@ -77,53 +124,10 @@ def main():
         traceback.print_exc()
         return 1
 
-    overrides_applied = False
     if args.override:
         print("\nApplying overrides:")
-        for item in args.override:
-            parts = item.split(':', 1)
-            if len(parts) == 2:
-                key = parts[0].strip()
-                value_str = parts[1].strip()
-                if not key:
-                    print(f"  Warning: Invalid override format (empty key): '{item}'. Skipping.")
-                    continue
-
-                parsed_value = parse_override_value(value_str)
-                keys = key.split('.')
-                current_level = config_data
-                try:
-                    for i, k in enumerate(keys[:-1]):
-                        if isinstance(current_level, dict) and k in current_level:
-                             if isinstance(current_level[k], dict):
-                                 current_level = current_level[k]
-                             else:
-                                 print(f"  Warning: Intermediate key '{k}' in '{key}' exists but is not a dictionary. Cannot traverse further. Skipping override.")
-                                 current_level = None
-                                 break
-                        else:
-                             print(f"  Warning: Intermediate key '{k}' in '{key}' not found. Skipping override.")
-                             current_level = None
-                             break
-
-                    if current_level is not None:
-                        final_key = keys[-1]
-                        if isinstance(current_level, dict):
-                            if final_key in current_level:
-                                original_value = current_level.get(final_key, '<Key did not exist>')
-                                print(f"  Overriding key '{key}': '{original_value}' (original) -> '{parsed_value}' ({type(parsed_value).__name__})")
-                                current_level[final_key] = parsed_value
-                                overrides_applied = True
-                            else:
-                                print(f"  Warning: Key '{key}' (or final key '{final_key}') not found in the configuration. Skipping override.")
-                        else:
-                            print(f"  Warning: Cannot apply final key '{final_key}' because the target level is not a dictionary. Skipping override for '{key}'.")
-
-                except Exception as e:
-                    print(f"  Error applying override for key '{key}' with value string '{value_str}': {e}. Skipping.")
-            else:
-                print(f"  Warning: Invalid override format (missing ':'?): '{item}'. Skipping.")
-        if not overrides_applied and args.override:
+        overrides_applied = apply_overrides(config_data, args.override)
+        if not overrides_applied:
              print("  No valid overrides were applied.")
     else:
         print("\nNo overrides specified.")
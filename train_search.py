@@ -0,0 +1,181 @@
+import argparse
+import copy
+import datetime
+import itertools
+import json
+import math
+import pathlib
+import subprocess
+import sys
+import traceback
+
+from train_json_edit import apply_overrides, parse_override_value
+
+
+def parse_search(items):
+    space = []
+    for item in items:
+        key, sep, value_str = item.partition(':')
+        values = parse_override_value(value_str.strip())
+        if not sep or not key.strip() or not isinstance(values, (list, tuple)) or not values:
+            raise ValueError(f"Invalid search format: '{item}'. Expected KEY:[VALUE, VALUE, ...]")
+        space.append((key.strip(), list(values)))
+    return space
+
+
+def get_value(config_data, key):
+    value = config_data
+    for k in key.split('.'):
+        value = value[k]
+    return value
+
+
+def rung_budgets(min_steps, max_steps, eta):
+    budgets = []
+    budget = min_steps
+    while budget < max_steps:
+        budgets.append(budget)
+        budget *= eta
+    budgets.append(max_steps)
+    return budgets
+
+
+def run_candidate(args, config_data, candidate, rung, budget, max_steps):
+    """Trains a candidate up to budget steps, resuming from its previous rung, and returns its loss.
+
+    Every rung keeps the full step count in the JSON so the LR schedule is built for the final length,
+    and stops with --stop-at-step; modules/run_state.py restores the schedule position on resume.
+    A resumed trainer counts its loop from 0, so on the final rung --skip-after-stop lets the loop run
+    out without training and the trainer saves the final LoRA.
+    """
+
+    run_dir = candidate["dir"]
+    resumed_step = candidate["step"]
+
+    config = copy.deepcopy(config_data)
+    apply_overrides(config, args.override + candidate["overrides"] + [f"{args.steps_key}:{max_steps}"])
+
+    config_path = run_dir / f"config_rung{rung}.json"
+    metrics_path = run_dir / f"metrics_rung{rung}.json"
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2, ensure_ascii=False)
+
+    command = [
+        sys.executable,
+        args.train_script_path,
+        str(config_path),
+        "--state-file", str(run_dir / "state.pt"),
+        "--metrics-file", str(metrics_path),
+        "--stop-at-step", str(budget),
+    ]
+    if budget == max_steps: command.append("--skip-after-stop")
+    if args.models_dir: command.extend(["--models-dir", args.models_dir])
+    if args.ckpt_dir:   command.extend(["--ckpt-dir", args.ckpt_dir])
+    if args.vae_dir:    command.extend(["--vae-dir", args.vae_dir])
+    # each candidate saves into its own directory so the candidates do not overwrite each other's LoRA files
+    command.extend(["--lora-dir", str(candidate["lora_dir"])])
+
+    print(f"\n[rung {rung}] {candidate['name']} {candidate['overrides']}: steps {resumed_step} -> {budget}")
+    print(" ".join(f'"{arg}"' if ' ' in arg else arg for arg in command))
+
+    with open(run_dir / "train.log", 'a', encoding='utf-8') as log:
+        result = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT)
+
+    if result.returncode != 0 or not metrics_path.is_file():
+        print(f"  Warning: {candidate['name']} failed with exit code {result.returncode}, see {run_dir / 'train.log'}")
+        return math.inf
+
+    with open(metrics_path, 'r', encoding='utf-8') as f:
+        metrics = json.load(f)
+    candidate["step"] = metrics["step"]
+    loss = metrics["loss"] if metrics["loss"] is not None else math.inf
+    print(f"  loss {loss:.6f} at step {metrics['step']}")
+    return loss
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Search JSON config values with successive halving: train all candidates briefly, then resume only the best ones for longer.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+
+    parser.add_argument("json_path", type=str, help="Path to the original JSON configuration file")
+    parser.add_argument("--models-dir", type=str, default=None, help="Base directory for models (passed to train_j.py)")
+    parser.add_argument("--ckpt-dir", type=str, default=None, help="Directory for Checkpoints (passed to train_j.py)")
+    parser.add_argument("--vae-dir", type=str, default=None, help="Directory for VAE models (passed to train_j.py)")
+
+    parser.add_argument("--search", nargs='+', metavar="KEY:[VALUES]", required=True, help='Values to search. Format is "key:[value, value, ...]". Candidates are all combinations.')
+    parser.add_argument("--override", nargs='+', metavar="KEY:VALUE", default=[], help='Override a JSON parameter for every candidate. Format is "key:value".')
+    parser.add_argument("--steps-key", type=str, default="train_iterations", help="JSON key holding the number of training steps")
+    parser.add_argument("--min-steps", type=int, default=100, help="Steps every candidate trains in the first rung")
+    parser.add_argument("--max-steps", type=int, default=None, help="Steps the surviving candidates train to (default: value of --steps-key in the JSON)")
+    parser.add_argument("--eta", type=int, default=3, help="Each rung keeps 1/eta of the candidates and multiplies the steps by eta")
+    parser.add_argument("--train-script-path", type=str, default="train_j.py", help="Path to the train_j.py script")
+    parser.add_argument("--work-dir", type=str, default=None, help="Directory for candidate configs, logs and states (default: search_runs/<json name>_<timestamp>)")
+
+    args = parser.parse_args()
+
+    try:
+        original_json_path = pathlib.Path(args.json_path)
+        with open(original_json_path, 'r', encoding='utf-8') as f:
+            config_data = json.load(f)
+        space = parse_search(args.search)
+        max_steps = args.max_steps or int(get_value(config_data, args.steps_key))
+    except Exception as e:
+        print(f"Error: {e}")
+        return 1
+
+    if args.eta < 2 or args.min_steps < 1 or args.min_steps > max_steps:
+        print(f"Error: Need eta >= 2 and 1 <= min steps ({args.min_steps}) <= max steps ({max_steps}).")
+        return 1
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    work_dir = pathlib.Path(args.work_dir or pathlib.Path("search_runs") / f"{original_json_path.stem}_{timestamp}")
+
+    candidates = []
+    for i, values in enumerate(itertools.product(*[values for _, values in space])):
+        run_dir = work_dir / f"c{i:03d}"
+        (run_dir / "lora").mkdir(parents=True, exist_ok=True)
+        candidates.append({
+            "name": run_dir.name,
+            "dir": run_dir,
+            "lora_dir": (run_dir / "lora").resolve(),
+            "overrides": [f"{key}:{value!r}" for (key, _), value in zip(space, values)],
+            "step": 0,
+            "losses": [],
+        })
+
+    budgets = rung_budgets(args.min_steps, max_steps, args.eta)
+    print(f"{len(candidates)} candidates, rungs at steps {budgets}, results in {work_dir}")
+
+    alive = candidates
+    try:
+        for rung, budget in enumerate(budgets):
+            final = rung == len(budgets) - 1
+            for candidate in alive:
+                candidate["losses"].append(run_candidate(args, config_data, candidate, rung, budget, max_steps))
+
+            alive = sorted(alive, key=lambda c: c["losses"][-1])
+            if not final:
+                alive = alive[:max(1, len(alive) // args.eta)]
+                print(f"\n[rung {rung}] promoted: {', '.join(c['name'] for c in alive)}")
+    except KeyboardInterrupt:
+        print("\nSearch interrupted.")
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        ranking = sorted(candidates, key=lambda c: (-len(c["losses"]), c["losses"][-1] if c["losses"] else math.inf))
+        summary = [{"name": c["name"], "overrides": c["overrides"], "step": c["step"], "losses": c["losses"], "lora_dir": str(c["lora_dir"])} for c in ranking]
+        with open(work_dir / "summary.json", 'w', encoding='utf-8') as f:
+            json.dump({"budgets": budgets, "candidates": summary}, f, indent=2)
+
+        print("\nRanking (furthest rung first, then loss):")
+        for c in summary:
+            print(f"  {c['name']} step {c['step']:>6} loss {c['losses'][-1] if c['losses'] else math.inf:.6f} {' '.join(c['overrides'])}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())